@@ -0,0 +1,170 @@
+import datetime
+from typing import List, Tuple, Union
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+import colorsys
+import csv
+import json
+
+import numpy as np
+
+try:
+    # faster parser for the distance and duration matrices
+    import orjson
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+# Shared by the offline map and the online map tools. The loaders are memoized on the path and the
+# modification time of the files, a file is parsed again only if it was modified
+
+POINTS_DELIMITER = ";" # delimiter of the CSV file of the collection points
+
+
+@dataclass(frozen=True)
+class RoutePoint:
+    """Class representing a point of the route"""
+    __slots__ = ("index", "latitude", "longitude", "service_time")
+    index : int # index of the route point in the array of points, -1 if it is not a collection point
+    latitude: float
+    longitude: float
+    service_time: datetime.timedelta # service time of a point
+
+
+def hsv_to_hex(color: Tuple[float, float, float]):
+    """Convert a hsv color (tuple of values between 0 and 1) to a hex color string"""
+    return "#" + "".join(f"{int(255 * c):02x}" for c in colorsys.hsv_to_rgb(*color))
+
+
+def validate_raw_routes(routes: List[List[Union[List[float], int]]]):
+    """Validate the content of the routes file"""
+    try:
+        assert isinstance(routes, list)
+        for route in routes:
+            assert isinstance(route, list)
+            for e in route:
+                if isinstance(e, list):
+                    assert len(e) == 2
+                    assert isinstance(e[0], (float, int))
+                    assert isinstance(e[1], (float, int))
+                elif isinstance(e, int):
+                    pass
+                else:
+                    assert False
+    except AssertionError:
+        raise ValueError("Invalid routes")
+    return routes
+
+
+def _file_key(file_path: Path):
+    """Private function, return the key of the content of a file for the memoized loaders"""
+    file_path = Path(file_path).resolve()
+    return file_path, file_path.stat().st_mtime_ns
+
+
+def _read_only(array: np.ndarray):
+    """Private function, lock an array returned by a memoized loader, it is shared by all the callers"""
+    array.flags.writeable = False
+    return array
+
+
+def load_json_file(file_path: Path):
+    """
+    Read JSON file
+    :param file_path: Path
+        Path of the JSON file
+    :return: List
+    """
+    if USE_ORJSON:
+        return orjson.loads(Path(file_path).read_bytes())
+    with open(file_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_points(points_file_path: Path, service_times_file_path: Path):
+    """
+    Read the collection points file and the service time file
+    :param points_file_path: Path
+        Path of the file containing the information on the collection points and the depot
+    :param service_times_file_path: Path
+        Path of the file containing the service time of each point
+    :return: Tuple[Tuple(RoutePoint), np.ndarray, np.ndarray]
+        Array of collection points and depot, array of shape (2, N) of their latitudes and longitudes
+        and array of their service times in seconds
+    """
+    return _load_points(_file_key(points_file_path), _file_key(service_times_file_path))
+
+
+@lru_cache(maxsize=None)
+def _load_points(points_file_key, service_times_file_key):
+    """Private function, memoized implementation of load_points"""
+    (points_file_path, _), (service_times_file_path, _) = points_file_key, service_times_file_key
+    with points_file_path.open(mode="r", encoding="utf-8", newline="\n") as p_f:
+        with service_times_file_path.open(mode="r", encoding="utf-8", newline="\n") as st_f:
+            p_reader = csv.reader(p_f, delimiter=POINTS_DELIMITER)
+            st_reader = csv.reader(st_f)
+            # offsets of the columns, read once in the headers
+            p_header = next(p_reader)
+            i_index = p_header.index("index")
+            i_latitude = p_header.index("latitude")
+            i_longitude = p_header.index("longitude")
+            i_service_time = next(st_reader).index("service_time")
+            points = tuple(
+                RoutePoint(
+                    index=int(p_row[i_index]),
+                    latitude=float(p_row[i_latitude]),
+                    longitude=float(p_row[i_longitude]),
+                    service_time=datetime.timedelta(seconds=float(st_row[i_service_time])),
+                )
+                # empty lines are skipped as csv.DictReader does
+                for (p_row, st_row) in zip(filter(None, p_reader), filter(None, st_reader))
+            )
+    coordinates = np.stack([
+        np.fromiter((p.latitude for p in points), dtype=np.float64, count=len(points)),
+        np.fromiter((p.longitude for p in points), dtype=np.float64, count=len(points)),
+    ])
+    service_times = np.fromiter(
+        (p.service_time.total_seconds() for p in points), dtype=np.float64, count=len(points)
+    )
+    return points, _read_only(coordinates), _read_only(service_times)
+
+
+def load_raw_routes(routes_file_path: Path):
+    """
+    Read and validate the routes file
+    :param routes_file_path: Path
+        Path of the file containing the array of routes
+    :return: Tuple[Tuple[Union[Tuple[float, float], int]]]
+        Array of routes, each route point is either an index in the array of points or a (lat, lon) pair
+    """
+    return _load_raw_routes(_file_key(routes_file_path))
+
+
+@lru_cache(maxsize=None)
+def _load_raw_routes(routes_file_key):
+    """Private function, memoized implementation of load_raw_routes"""
+    raw_routes = validate_raw_routes(load_json_file(routes_file_key[0]))
+    return tuple(
+        tuple(raw_e if isinstance(raw_e, int) else tuple(raw_e) for raw_e in raw_route)
+        for raw_route in raw_routes
+    )
+
+
+def load_matrices(distances_file_path: Path, durations_file_path: Path):
+    """
+    Read the distance and the duration matrices
+    :param distances_file_path: Path
+        Path of the JSON file of the distance matrix in meters between the points
+    :param durations_file_path: Path
+        Path of the JSON file of the duration matrix in seconds between the points
+    :return: Tuple[np.ndarray, np.ndarray]
+        Distance and duration matrices
+    """
+    return _load_matrix(_file_key(distances_file_path)), _load_matrix(_file_key(durations_file_path))
+
+
+@lru_cache(maxsize=None)
+def _load_matrix(file_key):
+    """Private function, memoized reading of a matrix of a JSON file"""
+    return _read_only(np.asarray(load_json_file(file_key[0]), dtype=np.float64))
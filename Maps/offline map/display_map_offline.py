@@ -1,30 +1,49 @@
 import datetime
 import math
-from typing import Any, List, Mapping, Optional, Tuple, Union
+from typing import Any, List, Optional, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 from itertools import chain
 from enum import Enum
-import colorsys
-import csv
-import json
+from functools import lru_cache
+import sys
 
 import matplotlib
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
+try:
+    # columnar reader of GDAL, the geometries are streamed as Arrow batches into the GeoDataFrame
+    import pyogrio
+    import pyarrow
+    USE_PYOGRIO = True
+except ImportError:
+    USE_PYOGRIO = False
+
+# loaders shared with the online map, in the parent folder
+MAPS_DIR_PATH = str(Path(__file__).resolve().parent.parent)
+if MAPS_DIR_PATH not in sys.path:
+    sys.path.insert(0, MAPS_DIR_PATH)
+from maps_io import RoutePoint, load_matrices, load_points, load_raw_routes
+
 # Path definitions
 DATA_DIR_PATH = Path(__file__).parent.resolve() / "data" # data folder
 POINTS_FILE_PATH = DATA_DIR_PATH / "points.csv" # collection point information file
-POINTS_DELIMITER = ";" # delimiter of CSV file
 MAP_DIR_PATH = Path(__file__).parent.resolve() / "maps" # map folder
 
+# Base map figure kept between the calls of create_map, see get_basemap
+_BASEMAP = None
+
 # Saturation and value of the element colors (from 0 to 1)
 TRACK_SV = (0.4, 0.4)
 USED_TRACK_SV = (0.3, 0.9)
 POINT_SV = (0.8, 0.9)
+# in the order of the ItineraryElement values
+ELEMENTS_SV = np.array([TRACK_SV, USED_TRACK_SV, POINT_SV])
 
 
 def load_area_map(mapfile : Path):
@@ -33,46 +52,37 @@ def load_area_map(mapfile : Path):
     mapfile: Path
         Path of the JSON file
     """
+    if USE_PYOGRIO:
+        # the CRS read by pyogrio is dropped, like with from_features, so that the map is plotted the same way
+        return gpd.read_file(mapfile, engine="pyogrio", use_arrow=True).set_crs(None, allow_override=True)
     df = pd.read_json(mapfile)
     map = gpd.GeoDataFrame.from_features(df["features"]) # convert json to GeoDataFrame
     return map
 
 
-@dataclass
-class RoutePoint:
-    """Class representing a point of the route"""
-    index : int # index of the route point in the array of points
-    latitude: float
-    longitude: float
-    service_time: datetime.timedelta # service time of a point
-
-
-def hsv_to_hex(color: Tuple[float, float, float]):
-    """Convert a hsv color (tuple of values between 0 and 1) to a hex color string"""
-    return "#" + "".join(f"{int(255 * c):02x}" for c in colorsys.hsv_to_rgb(*color))
-
-
 class ItineraryElement(Enum):
     TRACK = 0
     USED_TRACK = 1
     POINT = 2
 
 
-class ItineraryColor:
-    ElementsSV: Mapping[ItineraryElement, Tuple[float, float]] = {
-        ItineraryElement.TRACK: TRACK_SV,
-        ItineraryElement.USED_TRACK: USED_TRACK_SV,
-        ItineraryElement.POINT: POINT_SV,
-    }
-
-    def __init__(self, N: int, i: int):
-        self.hue = i / N
-
-    def get(self, obj: ItineraryElement):
-        """Get the color associated to an element"""
-        h = self.hue
-        s, v = ItineraryColor.ElementsSV[obj]
-        return hsv_to_hex((h, s, v))
+@lru_cache(maxsize=None)
+def build_palette(N: int):
+    """
+    Return the colors of the itinerary elements of N routes, the hue of the route i is i / N
+    :param N: int
+        Number of routes
+    :return: np.ndarray
+        Array of shape (3, N) of hex color strings, indexed by the value of an ItineraryElement and the
+        index of a route
+    """
+    hsv = np.empty((len(ELEMENTS_SV), N, 3))
+    hsv[:, :, 0] = np.arange(N) / N
+    hsv[:, :, 1:] = ELEMENTS_SV[:, None, :]
+    rgb = (255 * matplotlib.colors.hsv_to_rgb(hsv)).astype(int)
+    palette = np.array([[f"#{r:02x}{g:02x}{b:02x}" for (r, g, b) in row] for row in rgb.tolist()])
+    palette.flags.writeable = False  # shared by all the calls with the same N
+    return palette
 
 
 @dataclass
@@ -85,127 +95,88 @@ class ItineraryRepr:
     duration: datetime # total duration of the route
 
     def __post_init__(self):
-        self.color = ItineraryColor(self.n_route, self.index)
+        self.palette = build_palette(self.n_route)
+        # indices of the route points in the array of points
+        self.indices = np.fromiter((p.index for p in self.route), dtype=np.int32, count=len(self.route))
 
-    def add_points_to_map(self, ax, display_pickup_order: bool, display_info: bool):
+    def get_label(self, display_info: bool):
         """
-        Add the route points of the itinerary to the given plot
-        :param ax:
-            Axe of the subplot
-        :param display_pickup_order: bool
-            True if the collection order is displayed on the map
+        Return the legend label of the route
         :param display_info: bool
-            True if the distance and the duration of each route is displayed on the map
+            True if the distance and the duration of the route is displayed in the label
         """
-        # plot collection points
-        X = [pt.longitude for pt in self.route[1:-1]]
-        Y = [pt.latitude for pt in self.route[1:-1]]
         label_routes = f"route {self.index}"
         if display_info:
             t = datetime.timedelta(seconds=self.duration.seconds)
             label_routes += f", distance {math.ceil(self.distance / 1000.0)} km, "f"duration {t}"
-        ax.plot(X, Y, 'o', color=self.color.get(ItineraryElement.POINT), label=label_routes)
-
-        if display_pickup_order:
-            for (i, p) in enumerate(self.route[1:-1]):
-                ax.text(p.longitude, p.latitude, str(i), color=self.color.get(ItineraryElement.POINT), fontsize=12)
+        return label_routes
 
-        # plot starting depot
-        ax.plot([self.route[0].longitude], [self.route[0].latitude], 's', color='blue')
-
-        # plot ending depot
-        ax.plot([self.route[-1].longitude], [self.route[-1].latitude], 's', color='blue')
-
-        ax.legend(loc='upper center', shadow=True, fontsize='x-large')
-
-    def compute_distance_and_duration(self, distances_json, durations_json):
+    def add_pickup_order_to_map(self, ax):
         """
-        Compute the total distance and duration of the route
-        :param distances_json:
-            Distance matrix in meters between the points
-        :param durations_json:
-            Duration matrix in meters between the points
+        Add the collection order of the route points to the given plot
+        :param ax:
+            Axe of the subplot
         """
-        # between collection points
-        for i in range(0, len(self.route) - 1):
-            start_point = self.route[i]
-            end_point = self.route[i + 1]
-            self.distance += distances_json[start_point.index][end_point.index]
-            self.duration += datetime.timedelta(seconds=durations_json[start_point.index][end_point.index])
-            if i > 0:
-                self.duration += start_point.service_time
+        for (i, p) in enumerate(self.route[1:-1]):
+            ax.text(p.longitude, p.latitude, str(i), color=self.palette[ItineraryElement.POINT.value, self.index], fontsize=12,
+                    rasterized=True)
 
 
-def load_json_file(file_path: Path):
-    """
-    Read JSON file
-    :param file_path: Path
-        Path of the JSON file
-    :return: List
-    """
-    f = open(file_path)
-    data = json.load(f)
-    f.close()
-    return data
-
-
-def validate_raw_routes(routes: List[List[Union[List[float], int]]]):
-    """Validate the content of the routes file"""
-    try:
-        assert isinstance(routes, list)
-        for route in routes:
-            assert isinstance(route, list)
-            for e in route:
-                if isinstance(e, list):
-                    assert len(e) == 2
-                    assert isinstance(e[0], (float, int))
-                    assert isinstance(e[1], (float, int))
-                elif isinstance(e, int):
-                    pass
-                else:
-                    assert False
-    except AssertionError:
-        raise ValueError("Invalid routes")
-    return routes
-
-
-def load_points(service_times_file_path: Path):
+def compute_distances_and_durations(
+    itineraries: List[ItineraryRepr],
+    distances: np.ndarray,
+    durations: np.ndarray,
+    service_times: np.ndarray
+):
     """
-    Read the routes file and the service time file and resturns the route points of each route
-    :param service_times_file_path: Path
-        Path of the file containing the service time of each point
-    :return: List(RoutePoint)
-        Array of collection points and depot
+    Compute the total distance and duration of all the routes at once. The routes are concatenated in a
+    single array of point indices, the legs of every route are gathered in one call and summed per route
+    :param itineraries: List[ItineraryRepr]
+        Array of the routes
+    :param distances: np.ndarray
+        Distance matrix in meters between the points
+    :param durations: np.ndarray
+        Duration matrix in seconds between the points
+    :param service_times: np.ndarray
+        Service time in seconds of each point
     """
-    points = []
-    with POINTS_FILE_PATH.open(mode="r", encoding="utf-8", newline="\n") as p_f:
-        with service_times_file_path.open(mode="r", encoding="utf-8", newline="\n") as st_f:
-            points = [
-                RoutePoint(
-                    index=int(p_row["index"]),
-                    latitude=float(p_row["latitude"]),
-                    longitude=float(p_row["longitude"]),
-                    service_time=datetime.timedelta(seconds=float(st_row["service_time"])),
-                )
-                for (p_row, st_row) in zip(
-                    csv.DictReader(p_f, delimiter=POINTS_DELIMITER), csv.DictReader(st_f)
-                )
-            ]
-    return points
-
-
-def load_routes(routes_file_path: Path, points: list[RoutePoint]):
+    if not itineraries:
+        return
+    indices = np.concatenate([itin.indices for itin in itineraries])
+    lengths = np.array([itin.indices.size for itin in itineraries])
+    route_ids = np.repeat(np.arange(len(itineraries)), lengths)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    # legs between consecutive points, the ones from the end of a route to the start of the next are dropped
+    legs = route_ids[:-1] == route_ids[1:]
+    starts, ends = indices[:-1][legs], indices[1:][legs]
+    route_distances = np.bincount(route_ids[:-1][legs], weights=distances[starts, ends], minlength=len(itineraries))
+    route_durations = np.bincount(route_ids[:-1][legs], weights=durations[starts, ends], minlength=len(itineraries))
+
+    # service times of the collection points, the depots (first and last points of a route) are excluded
+    collection = np.ones(indices.size, dtype=bool)
+    collection[offsets[:-1]] = False
+    collection[offsets[1:] - 1] = False
+    route_durations += np.bincount(
+        route_ids[collection], weights=service_times[indices[collection]], minlength=len(itineraries)
+    )
+
+    for (itin, distance, duration) in zip(itineraries, route_distances, route_durations):
+        itin.distance += float(distance)
+        itin.duration += datetime.timedelta(seconds=float(duration))
+
+
+def load_routes(routes_file_path: Path, points: Tuple[RoutePoint, ...]):
     """
     Read the routes
     :param routes_file_path: Path
         Path of the file containing the array of routes
-    :param points: List(RoutePoint)
+    :param points: Tuple(RoutePoint)
         Array containing the information on the collection points and the depot
     :return: List[List[RoutePoint]]
         Array containing the routes
     """
-    with routes_file_path.open(mode="r", encoding="utf-8", newline="\n") as p_f:
-        raw_routes = validate_raw_routes(json.load(p_f))
+    raw_routes = load_raw_routes(routes_file_path)
 
     return [
         [points[raw_e] for raw_e in raw_route]
@@ -213,6 +184,58 @@ def load_routes(routes_file_path: Path, points: list[RoutePoint]):
     ]
 
 
+def add_points_to_map(
+    ax,
+    itineraries: List[ItineraryRepr],
+    coordinates: np.ndarray,
+    display_pickup_order: bool,
+    display_info: bool
+):
+    """
+    Add the route points of all the itineraries to the given plot
+    :param ax:
+        Axe of the subplot
+    :param itineraries: List[ItineraryRepr]
+        Array of the routes to display
+    :param coordinates: np.ndarray
+        Array of shape (2, N) of the latitudes and longitudes of the points
+    :param display_pickup_order: bool
+        True if the collection order is displayed on the map
+    :param display_info: bool
+        True if the distance and the duration of each route is displayed on the map
+    """
+    if not itineraries:
+        return
+    # plot the collection points of every route with a single collection
+    latitudes, longitudes = coordinates
+    points_indices = np.concatenate([itin.indices[1:-1] for itin in itineraries])
+    X = longitudes[points_indices]
+    Y = latitudes[points_indices]
+    route_colors = np.array([
+        matplotlib.colors.to_rgb(itin.palette[ItineraryElement.POINT.value, itin.index]) for itin in itineraries
+    ])
+    colors = np.repeat(route_colors.reshape(-1, 3), [itin.indices.size - 2 for itin in itineraries], axis=0)
+    marker_size = plt.rcParams['lines.markersize']
+    # the markers are composited in a single raster layer, the roads and the city names stay vectorial
+    ax.scatter(X, Y, s=marker_size ** 2, c=colors, marker='o', rasterized=True, zorder=3)
+
+    if display_pickup_order:
+        for itin in itineraries:
+            itin.add_pickup_order_to_map(ax)
+
+    # plot starting and ending depots
+    depots_indices = np.concatenate([itin.indices[[0, -1]] for itin in itineraries])
+    ax.scatter(longitudes[depots_indices], latitudes[depots_indices], s=marker_size ** 2, c='blue', marker='s', zorder=3)
+
+    # proxy artists so that each route keeps its own entry in the legend
+    handles = [
+        Line2D([], [], linestyle='', marker='o', color=itin.palette[ItineraryElement.POINT.value, itin.index],
+               label=itin.get_label(display_info))
+        for itin in itineraries
+    ]
+    ax.legend(handles=handles, loc='upper center', shadow=True, fontsize='x-large')
+
+
 def display_cities(ax):
     color = 'brown'
     ax.text(6.4942451080053445, 44.56531777972838, "Embrun", color=color, fontsize=12)
@@ -227,6 +250,35 @@ def display_cities(ax):
     ax.text(6.365671485263661, 44.596192852916275, "Reallon", color=color, fontsize=12)
 
 
+def get_basemap(mapfile: Path):
+    """
+    Return the figure and the axe of the road map with the city names. The figure is created at the first
+    call and reused by the next ones, the routes drawn by a previous call are removed. It is created again
+    only if the map file was modified
+    :param mapfile: Path
+        Path of the JSON file containing the data on the roads
+    :return: Tuple
+        Figure and axe of the road map
+    """
+    global _BASEMAP
+    key = (mapfile, mapfile.stat().st_mtime)
+    if _BASEMAP is None or _BASEMAP[0] != key:
+        if _BASEMAP is not None:
+            plt.close(_BASEMAP[1])
+        map = load_area_map(mapfile)
+        fig, ax = plt.subplots()
+        map.plot(ax = ax, linewidth = 1, edgecolor = 'grey')
+        display_cities(ax)
+        h, w = fig.get_size_inches()
+        fig.set_size_inches(h * 3, w * 3)
+        _BASEMAP = (key, fig, ax, set(ax.get_children()))
+
+    _, fig, ax, basemap_artists = _BASEMAP
+    for artist in ax.get_children():
+        if artist not in basemap_artists:
+            artist.remove()
+    return fig, ax
+
 
 def create_map(
     routes_file_path: Path,
@@ -239,11 +291,9 @@ def create_map(
     service_times_file_path is a path to the file containing the service time of each point.
     """
 
-    map = load_area_map(DATA_DIR_PATH / 'Serre-poncon.json')
-    collection_points = load_points(DATA_DIR_PATH / "exemple_points_service_time.csv")
+    collection_points, coordinates, service_times = load_points(POINTS_FILE_PATH, service_times_file_path)
     routes = load_routes(routes_file_path, collection_points)
-    distances_json = load_json_file(DATA_DIR_PATH / "distances.json")
-    durations_json = load_json_file(DATA_DIR_PATH / "durations.json")
+    distances, durations = load_matrices(DATA_DIR_PATH / "distances.json", DATA_DIR_PATH / "durations.json")
 
     itineraries_repr = [
         ItineraryRepr(
@@ -256,21 +306,11 @@ def create_map(
         for (i, route) in enumerate(routes)
     ]
 
-    fig, ax = plt.subplots()
-    map.plot(ax = ax, linewidth = 1, edgecolor = 'grey')
-    display_cities(ax)
-
-    for itin in itineraries_repr:
-        itin.compute_distance_and_duration(distances_json, durations_json)
-        itin.add_points_to_map(ax=ax, display_pickup_order=_display_pickup_order, display_info=_display_info)
-
-
+    fig, ax = get_basemap(DATA_DIR_PATH / 'Serre-poncon.json')
+    compute_distances_and_durations(itineraries_repr, distances, durations, service_times)
+    add_points_to_map(ax, itineraries_repr, coordinates, display_pickup_order=_display_pickup_order, display_info=_display_info)
 
-    f = plt.gcf()
-    dpi = f.get_dpi()
-    h, w = f.get_size_inches()
-    f.set_size_inches(h * 3, w * 3)
-    f.savefig(MAP_DIR_PATH / 'map_routes.png')
+    fig.savefig(MAP_DIR_PATH / 'map_routes.png', dpi=150)
 
 
 def main():
@@ -286,4 +326,5 @@ def main():
         _display_info=True
     )
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import datetime
-from math import hypot
-from typing import Any, List, Mapping, Optional, Tuple, Union
+from typing import Any, List, Mapping, Optional, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 from itertools import chain
 from enum import Enum
-import colorsys
-import csv
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import hashlib
 import json
+import os
+import sys
+import tempfile
 
 from folium.folium import Map
 from folium.map import Popup
@@ -15,7 +18,16 @@ from folium.vector_layers import CircleMarker, PolyLine
 from folium.plugins.timestamped_geo_json import TimestampedGeoJson
 from folium.plugins.fullscreen import Fullscreen
 import requests
+from requests.adapters import HTTPAdapter
 import polyline
+import numpy as np
+from scipy.spatial import cKDTree
+
+# loaders shared with the offline map, in the parent folder
+MAPS_DIR_PATH = str(Path(__file__).resolve().parent.parent)
+if MAPS_DIR_PATH not in sys.path:
+    sys.path.insert(0, MAPS_DIR_PATH)
+from maps_io import RoutePoint, hsv_to_hex, load_points, load_raw_routes
 
 # je suis la
 # tiles to use for the map background, HOT tiles are prettier but the standart ones work better
@@ -31,11 +43,17 @@ POINT_RADIUS = 8
 TRACK_SV = (0.4, 0.4)
 USED_TRACK_SV = (0.3, 0.9)
 POINT_SV = (0.8, 0.9)
+# in the order of the ItineraryElement values
+ELEMENTS_SV = (TRACK_SV, USED_TRACK_SV, POINT_SV)
+
+# Approximate length in meters of a degree of latitude and of longitude in france, the distances
+# computed with it are good approximations for small distances
+METERS_PER_DEGREE = (111194.9, 75905.5)
 
 # Path definitions
 DATA_DIR_PATH = Path(__file__).parent.resolve() / "data"
 POINTS_FILE_PATH = DATA_DIR_PATH / "points.csv"
-POINTS_DELIMITER = ";"
+OSRM_CACHE_DIR_PATH = DATA_DIR_PATH / "osrm_cache"  # responses of the OSRM server
 
 # OSRM Server to use to compute itineraries, demo OSRM server should be enough
 OSRM_SERVER = "http://router.project-osrm.org"
@@ -45,73 +63,54 @@ OSRM_ROUTE_REQUEST_TEMPLATE = (
     OSRM_SERVER + "/route/v1/driving/polyline({})?geometries=geojson&overview=full"
 )
 
+# Number of itineraries requested at the same time to the OSRM server
+OSRM_MAX_WORKERS = 8
 
-def hsv_to_hex(color: Tuple[float, float, float]):
-    """Convert a hsv color (tuple of values between 0 and 1) to a hex color string"""
-    return "#" + "".join(f"{int(255 * c):02x}" for c in colorsys.hsv_to_rgb(*color))
-
-
-def approx_dist_to(p1: Tuple[float, float], p2: Tuple[float, float]):
-    """Approximation for the distance in meters between two lat/lon, works for small distances in
-    france"""
-    return hypot((p1[0] - p2[0]) * 111194.9, (p1[1] - p2[1]) * 75905.5)
+# HTTP session shared by all the OSRM requests, the connections are kept alive between requests
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=OSRM_MAX_WORKERS))
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=OSRM_MAX_WORKERS))
 
 
 def timedelta_to_iso(tdelta: datetime.timedelta):
     """Convert a stlib timedelta to the iso period format"""
     tot_seconds = tdelta.total_seconds()
     days = int(tot_seconds // (3600 * 24))
-    time = "".join(
-        [
-            f"{value}{symbol}"
-            for (value, symbol) in [
-                (int(tot_seconds // 3600 % 24), "H"),
-                (int(tot_seconds // 60 % 60), "M"),
-                (int(tot_seconds % 60), "S"),
-            ]
-            if value
-        ]
-    )
+    hours = int(tot_seconds // 3600 % 24)
+    minutes = int(tot_seconds // 60 % 60)
+    seconds = int(tot_seconds % 60)
+    time = (f"{hours}H" if hours else "") + (f"{minutes}M" if minutes else "") + (f"{seconds}S" if seconds else "")
     return "P" + (f"{days}D" if days else "") + (f"T{time}" if time else "T0S")
 
 
-def validate_raw_routes(routes: List[List[Union[List[float], int]]]):
-    """Validate the content of the routes file"""
-    try:
-        assert isinstance(routes, list)
-        for route in routes:
-            assert isinstance(route, list)
-            for e in route:
-                if isinstance(e, list):
-                    assert len(e) == 2
-                    assert isinstance(e[0], (float, int))
-                    assert isinstance(e[1], (float, int))
-                elif isinstance(e, int):
-                    pass
-                else:
-                    assert False
-    except AssertionError:
-        raise ValueError("Invalid routes")
-    return routes
-
-
-@dataclass
-class RoutePoint:
-    latitude: float
-    longitude: float
-    service_time: datetime.timedelta
+@lru_cache(maxsize=None)
+def _cached_osrm(encoded_route: str, session: requests.Session = SESSION):
+    """Private function, return the OSRM response for the encoded route. The responses are saved in
+    OSRM_CACHE_DIR_PATH, the server is only requested for the routes never requested before"""
+    cache_file_path = OSRM_CACHE_DIR_PATH / f"{hashlib.sha1(encoded_route.encode()).hexdigest()}.json"
+    if cache_file_path.exists():
+        return json.loads(cache_file_path.read_bytes())
+    request = OSRM_ROUTE_REQUEST_TEMPLATE.format(encoded_route)
+    result = session.get(request)
+    if result.status_code != 200:
+        raise Exception(f"HTTP error, code {result.status_code}: {result.content}")
+    OSRM_CACHE_DIR_PATH.mkdir(exist_ok=True)
+    # written in a temporary file first so that an interrupted run does not leave a truncated response,
+    # each writer has its own temporary file since the same route can be fetched by several threads
+    with tempfile.NamedTemporaryFile(dir=OSRM_CACHE_DIR_PATH, suffix=".tmp", delete=False) as tmp_file:
+        tmp_file.write(result.content)
+    os.replace(tmp_file.name, cache_file_path)
+    return json.loads(result.text)
 
 
 def compute_itinerary_and_duration(
     route: List[RoutePoint],
+    session: requests.Session = SESSION,
 ) -> Tuple[List[Tuple[float, float]], datetime.timedelta]:
     """Compute the list of waypoints that a route should follow, and its duration"""
-    encoded_route: str = polyline.encode(((p.longitude, p.latitude) for p in route), geojson=True)  # type: ignore
-    request = OSRM_ROUTE_REQUEST_TEMPLATE.format(encoded_route)
-    result = requests.get(request)
-    if result.status_code != 200:
-        raise Exception(f"HTTP error, code {result.status_code}: {result.content}")
-    json_result = json.loads(result.text)
+    coordinates = [(p.longitude, p.latitude) for p in route]
+    encoded_route: str = polyline.encode(coordinates, geojson=True)  # type: ignore
+    json_result = _cached_osrm(encoded_route, session)
     route_result = json_result["routes"][0]
 
     return [
@@ -121,28 +120,15 @@ def compute_itinerary_and_duration(
 
 def load_routes(routes_file_path: Path, service_times_file_path: Path):
     """Read the routes file and the service time file and resturns the route points of each route"""
-    with POINTS_FILE_PATH.open(mode="r", encoding="utf-8", newline="\n") as p_f:
-        with service_times_file_path.open(mode="r", encoding="utf-8", newline="\n") as st_f:
-            points = [
-                RoutePoint(
-                    latitude=float(p_row["latitude"]),
-                    longitude=float(p_row["longitude"]),
-                    service_time=datetime.timedelta(seconds=float(st_row["service_time"])),
-                )
-                for (p_row, st_row) in zip(
-                    csv.DictReader(p_f, delimiter=POINTS_DELIMITER), csv.DictReader(st_f)
-                )
-            ]
-
-    with routes_file_path.open(mode="r", encoding="utf-8", newline="\n") as p_f:
-        raw_routes = validate_raw_routes(json.load(p_f))
+    points, _, _ = load_points(POINTS_FILE_PATH, service_times_file_path)
+    raw_routes = load_raw_routes(routes_file_path)
 
     return [
         [
             points[raw_e]
             if isinstance(raw_e, int)
             else RoutePoint(
-                latitude=raw_e[0], longitude=raw_e[1], service_time=datetime.timedelta()
+                index=-1, latitude=raw_e[0], longitude=raw_e[1], service_time=datetime.timedelta()
             )
             for raw_e in raw_route
         ]
@@ -156,21 +142,14 @@ class ItineraryElement(Enum):
     POINT = 2
 
 
-class ItineraryColor:
-    ElementsSV: Mapping[ItineraryElement, Tuple[float, float]] = {
-        ItineraryElement.TRACK: TRACK_SV,
-        ItineraryElement.USED_TRACK: USED_TRACK_SV,
-        ItineraryElement.POINT: POINT_SV,
-    }
-
-    def __init__(self, N: int, i: int):
-        self.hue = i / N
-
-    def get(self, obj: ItineraryElement):
-        """Get the color associated to an element"""
-        h = self.hue
-        s, v = ItineraryColor.ElementsSV[obj]
-        return hsv_to_hex((h, s, v))
+@lru_cache(maxsize=None)
+def build_palette(N: int):
+    """Return the colors of the itinerary elements of N routes, the hue of the route i is i / N. The
+    array of shape (3, N) of hex color strings is indexed by the value of an ItineraryElement and the
+    index of a route"""
+    palette = np.array([[hsv_to_hex((i / N, s, v)) for i in range(N)] for (s, v) in ELEMENTS_SV])
+    palette.flags.writeable = False  # shared by all the calls with the same N
+    return palette
 
 
 @dataclass
@@ -178,10 +157,14 @@ class ItineraryRepr:
     index: int
     n_route: int
     route: List[RoutePoint]
+    # waypoints and duration of the route, requested to OSRM if they are not given
+    itinerary: Optional[List[Tuple[float, float]]] = None
+    duration: Optional[datetime.timedelta] = None
 
     def __post_init__(self):
-        self.color = ItineraryColor(self.n_route, self.index)
-        self.itinerary, self.duration = compute_itinerary_and_duration(self.route)
+        self.palette = build_palette(self.n_route)
+        if self.itinerary is None or self.duration is None:
+            self.itinerary, self.duration = compute_itinerary_and_duration(self.route)
         self.start = self.itinerary[0]
         self.end = self.itinerary[-1]
 
@@ -196,7 +179,7 @@ class ItineraryRepr:
 
         PolyLine(
             locations=self.itinerary,
-            color=self.color.get(ItineraryElement.TRACK),
+            color=self.palette[ItineraryElement.TRACK.value, self.index],
             weight=TRACK_WIDTH,
             opacity=1,
         ).add_to(map)
@@ -219,43 +202,44 @@ class ItineraryRepr:
                 popup=Popup(popup_content),
                 max_width=500,
                 fill=True,
-                color="#000000" if is_depot else self.color.get(ItineraryElement.POINT),
+                color="#000000" if is_depot else self.palette[ItineraryElement.POINT.value, self.index],
             ).add_to(map)
 
     def _get_itinerary_times(self):
-        """Private method, return the list of timestamps of all the waypoints of the itinerary"""
-        timedelta = self.duration / (len(self.itinerary) - 1)
-        itinerary_index_service_time_map = {
-            min(
-                range(len(self.itinerary)),
-                key=lambda i: approx_dist_to(self.itinerary[i], (p.latitude, p.longitude)),
-            ): p.service_time
-            for p in self.route
-        }
-        times: list[datetime.datetime] = []
-        for i in range(len(self.itinerary)):
-            times.append(
-                (
-                    times[-1] + timedelta
-                    if len(times) > 0
-                    else datetime.datetime.combine(datetime.datetime.now(), datetime.time(hour=8))
-                )
-                + itinerary_index_service_time_map.get(i, datetime.timedelta())
-            )
-        return [t.isoformat() for t in times]
+        """Private method, return the list of timestamps of all the waypoints of the itinerary, as iso
+        strings and as datetimes"""
+        n_waypoints = len(self.itinerary)
+        timedelta_s = self.duration.total_seconds() / (n_waypoints - 1)
+        # nearest waypoint of each route point, the coordinates are scaled to meters so that the
+        # euclidean distance of the tree approximates the distance in meters
+        scale = np.asarray(METERS_PER_DEGREE)
+        tree = cKDTree(np.asarray(self.itinerary) * scale)
+        _, nearest = tree.query(np.array([(p.latitude, p.longitude) for p in self.route]) * scale, k=1)
+        # service time in seconds spent at each waypoint
+        service_s = np.zeros(n_waypoints)
+        service_s[nearest] = [p.service_time.total_seconds() for p in self.route]
+        # offset in seconds of each waypoint from the start of the route
+        deltas = np.full(n_waypoints, timedelta_s)
+        deltas[0] = 0.0
+        offsets = np.cumsum(deltas + service_s)
+        start = datetime.datetime.combine(datetime.datetime.now(), datetime.time(hour=8))
+        times = [start + datetime.timedelta(seconds=float(s)) for s in offsets]
+        return [t.isoformat() for t in times], times
 
     def get_itinerary_feature(self):
-        """Return a geojson representing the trackstyle and it timing"""
+        """Return a geojson representing the trackstyle and it timing, and the datetimes of the waypoints
+        of the itinerary (used to compute the duration of the animation without parsing the iso strings)"""
         coordinates = [(lon, lat) for (lat, lon) in self.itinerary]
+        times, times_dt = self._get_itinerary_times()
         geoJson = {
             "type": "FeatureCollection",
             "features": [
                 {
                     "type": "Feature",
                     "properties": {
-                        "times": self._get_itinerary_times(),
+                        "times": times,
                         "style": {
-                            "color": self.color.get(ItineraryElement.USED_TRACK),
+                            "color": self.palette[ItineraryElement.USED_TRACK.value, self.index],
                             "weight": TRACK_WIDTH,
                             "opacity": 1,
                         },
@@ -270,7 +254,7 @@ class ItineraryRepr:
                 }
             ],
         }
-        return geoJson
+        return geoJson, times_dt
 
 
 def add_geojson(
@@ -282,11 +266,6 @@ def add_geojson(
 ):
     """Adds a list of geojson features and adds the animation widget"""
     geoJson = {"type": "FeatureCollection", "features": features}
-    max_feature_duration = max(
-        datetime.datetime.fromisoformat(f["features"][0]["properties"]["times"][-1])
-        - datetime.datetime.fromisoformat(f["features"][0]["properties"]["times"][0])
-        for f in features
-    )
 
     transition_time = datetime.timedelta(seconds=1 / 40)
     TimestampedGeoJson(
@@ -314,15 +293,23 @@ def create_map(
     """
 
     routes = load_routes(routes_file_path, service_times_file_path)
+    shown_routes = [
+        (i, route) for (i, route) in enumerate(routes) if show is None or len(show) == 0 or i in show
+    ]
+
+    # the itineraries are requested concurrently, the map build is bound by the OSRM latency
+    with ThreadPoolExecutor(max_workers=OSRM_MAX_WORKERS) as executor:
+        results = list(executor.map(compute_itinerary_and_duration, (route for (_, route) in shown_routes)))
 
     itineraries_repr = [
         ItineraryRepr(
             index=i,
             n_route=len(routes),
             route=route,
+            itinerary=itinerary,
+            duration=duration,
         )
-        for (i, route) in enumerate(routes)
-        if show is None or len(show) == 0 or i in show
+        for ((i, route), (itinerary, duration)) in zip(shown_routes, results)
     ]
 
     map = Map(tiles=MAP_TILES, attr=" ")
@@ -331,22 +318,29 @@ def create_map(
     map.fit_bounds(bounds=list(chain.from_iterable(ir.itinerary for ir in itineraries_repr)))
     for ir in itineraries_repr:
         ir.add_track(map=map)
+    features, features_times = zip(*(ir.get_itinerary_feature() for ir in itineraries_repr))
     add_geojson(
         map,
-        features=[ir.get_itinerary_feature() for ir in itineraries_repr],
+        features=list(features),
         loop=loop,
         total_duration=duration,
-        max_feature_duration=max(ir.duration for ir in itineraries_repr),
+        max_feature_duration=max(times[-1] - times[0] for times in features_times),
     )
     for ir in itineraries_repr:
         ir.add_points(map=map)
     return map
 
 
-map = create_map(
-    routes_file_path=DATA_DIR_PATH / "exemple_routes.json",
-    service_times_file_path=DATA_DIR_PATH / "exemple_points_service_time.csv",
-    loop=False,
-    duration=datetime.timedelta(seconds=15),
-    show=[1, 2],
-)
+def main():
+    """Create the map of the example routes, the notebook `display_routes.ipynb` displays it"""
+    return create_map(
+        routes_file_path=DATA_DIR_PATH / "exemple_routes.json",
+        service_times_file_path=DATA_DIR_PATH / "exemple_points_service_time.csv",
+        loop=False,
+        duration=datetime.timedelta(seconds=15),
+        show=[1, 2],
+    )
+
+
+if __name__ == "__main__":
+    map = main()
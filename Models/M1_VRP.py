@@ -1,21 +1,36 @@
+import os
+from functools import lru_cache
+
+import numpy as np
 import pulp as pl
 import matplotlib.pyplot as plt
 import networkx as nx
 
 
 
+@lru_cache(maxsize=None)
+def disposition_graphe(sommets, aretes):
+     """Positions des sommets (spring_layout), calculées une seule fois pour un même graphe"""
+     G = nx.Graph()
+     G.add_nodes_from(sommets)
+     G.add_weighted_edges_from(aretes)
+     return nx.spring_layout(G, seed=42)
+
 def visualiser_graphe(D):
      n = len(D)
-     noms = ['A', 'B', 'C', 'D', 'E', 'F','OUT']
+     D = np.asarray(D)
+     noms = np.array(['A', 'B', 'C', 'D', 'E', 'F','OUT'][:n])
      G = nx.Graph()
      # Ajouter les sommets avec noms
-     G.add_nodes_from(noms[:n])
-     # Ajouter les arêtes avec poids
-     for i in range(n):
-          for j in range(i+1, n):
-               if D[i][j] != 0:
-                    G.add_edge(noms[i], noms[j], weight=D[i][j])
-     pos = nx.spring_layout(G, seed=42)
+     sommets = tuple(noms.tolist())
+     G.add_nodes_from(sommets)
+     # Ajouter les arêtes avec poids (triangle supérieur, poids non nuls)
+     i, j = np.triu_indices(n, 1)
+     w = D[i, j]
+     masque = w != 0
+     aretes = tuple(zip(noms[i[masque]].tolist(), noms[j[masque]].tolist(), w[masque].tolist()))
+     G.add_weighted_edges_from(aretes)
+     pos = disposition_graphe(sommets, aretes)
      edge_labels = nx.get_edge_attributes(G, 'weight')
      nx.draw(G, pos, with_labels=True, node_color='skyblue', node_size=700, font_size=14)
      nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
@@ -46,22 +61,22 @@ visualiser_graphe(Dv)
 
 
 # 3. Variables
-X = pl.LpVariable.dicts("X", ((i,j) for i in range(Np + Nd) for j in range(Np + Nd) for c in range(Nc)), cat="Binary") # X[c,i,j] = 1 si le camion c va de i à j
+X = pl.LpVariable.dicts("X", [(i,j) for i in range(Np + Nd) for j in range(Np + Nd) if i != j], cat="Binary") # X[i,j] = 1 si un camion va de i à j
 
 # 4. Fonction objectif
-M1 += pl.lpSum(D[i][j] * X[i,j] for i in range(Np + Nd) for j in range(Np + Nd))
+M1 += pl.lpSum(D[i][j] * X[i,j] for (i,j) in X)
 
 # 5. Contraintes
-for c in range(Nc):
-    for j in range(1, Np + Nd):
-          M1 += pl.lpSum(X[i,j] for i in range(Np + Nd) if i != j) == 1  # Chaque point de collecte est visité une fois
-    for i in range(1, Np + Nd):
-          M1 += pl.lpSum(X[i,j] for j in range(Np + Nd) if i != j) == 1  # Chaque point de collecte est quitté une fois
+for j in range(1, Np + Nd):
+     M1 += pl.lpSum(X[i,j] for i in range(Np + Nd) if i != j) == 1  # Chaque point de collecte est visité une fois
+for i in range(1, Np + Nd):
+     M1 += pl.lpSum(X[i,j] for j in range(Np + Nd) if i != j) == 1  # Chaque point de collecte est quitté une fois
 
 M1 += pl.lpSum(X[0,j] for j in range(1, Np + Nd)) <= Nc  # Limite le nombre de camions partant du dépôt
 M1 += pl.lpSum(X[i,0] for i in range(1, Np + Nd)) <= Nc  # Limite le nombre de camions revenant au dépôt
 
-
+# 6. Résolution
+M1.solve(pl.PULP_CBC_CMD(msg=0, threads=os.cpu_count()))
 
 # 7. Résultats
 print("Statut:", pl.LpStatus[M1.status])
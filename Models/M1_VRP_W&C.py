@@ -1,10 +1,83 @@
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+import math
+from typing import List, Dict
 
+import numpy as np
 
+try:
+    # compilation des noyaux numériques
+    from numba import njit, prange
+    USE_NUMBA = True
+except ImportError:
+    # sans numba les noyaux restent en Python pur
+    USE_NUMBA = False
+    prange = range
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
 
-@dataclass
+# à partir de ce nombre de noeuds les savings sont calculés en parallèle par numba
+PARALLEL_SAVINGS_MIN_NODES = 500
+
+
+
+@njit(cache=True)
+def _route_cost_nb(d, route):
+    """Somme des distances d'une tournée, compilée par numba."""
+    cost = 0.0
+    for k in range(route.shape[0] - 1):
+        cost += d[route[k], route[k + 1]]
+    return cost
+
+
+@njit(parallel=True, cache=True)
+def _savings_nb(d, depot, customers):
+    """
+    Savings de tous les couples de clients a < b, dans l'ordre de np.triu_indices,
+    calculés en parallèle sur les lignes par numba.
+    """
+    m = customers.shape[0]
+    s = np.empty(m * (m - 1) // 2)
+    for a in prange(m):
+        i = customers[a]
+        # position du couple (a, a + 1) : nombre de couples des lignes précédentes
+        start = a * m - a * (a + 1) // 2
+        for b in range(a + 1, m):
+            j = customers[b]
+            s[start + b - a - 1] = d[depot, i] + d[depot, j] - d[i, j]
+    return s
+
+
+@njit(cache=True)
+def _can_merge_nb(i, j, route_of_customer, route_head, route_tail, route_loads, Q):
+    """Test de ClarkeWrightReverseIRP.can_merge sur les tableaux des tournées, compilé par numba."""
+    ri = route_of_customer[i]
+    rj = route_of_customer[j]
+    if ri == rj:
+        return False
+    if not (route_head[ri] == i or route_tail[ri] == i):
+        return False
+    if not (route_head[rj] == j or route_tail[rj] == j):
+        return False
+    return route_loads[ri] + route_loads[rj] <= Q
+
+
+@njit(cache=True)
+def _next_merge_nb(savings_i, savings_j, start, route_of_customer, route_head, route_tail, route_loads, Q):
+    """
+    Parcours des savings triés à partir de l'indice start, compilé par numba.
+    Renvoie l'indice du premier couple (i, j) fusionnable, le nombre de savings s'il n'y en a aucun.
+    """
+    for k in range(start, savings_i.shape[0]):
+        if _can_merge_nb(savings_i[k], savings_j[k], route_of_customer, route_head, route_tail, route_loads, Q):
+            return k
+    return savings_i.shape[0]
+
+
+@dataclass(frozen=True)
 class ClarkeWrightResult:
+    __slots__ = ("routes", "total_cost")
     routes: List[List[int]]
     total_cost: float
 
@@ -29,65 +102,120 @@ class ClarkeWrightReverseIRP:
         :param vehicle_capacity: capacité maximale d'un véhicule
         :param depot: index du dépôt (par défaut 0)
         """
-        self.d = distance_matrix
-        self.n = len(distance_matrix)  # nb de noeuds (dépôt + clients)
+        # matrice stockée en un seul bloc contigu (ordre C), d[i][j] reste valide
+        self.d = np.ascontiguousarray(distance_matrix, dtype=np.float64)
+        self.n = self.d.shape[0]  # nb de noeuds (dépôt + clients)
         self.returns = returns
         self.Q = vehicle_capacity
         self.depot = depot
-
-        self.routes: List[List[int]] = []
-        self.route_loads: List[float] = []
-        self.route_of_customer: Dict[int, int] = {}  # client -> index de route
+        self.customers = np.delete(np.arange(self.n), depot)  # indices des clients
+        # quantités à collecter indexées par client, 0 pour un client absent de returns
+        self.returns_arr = np.zeros(self.n, dtype=np.float64)
+        for i, q_i in returns.items():
+            if 0 <= i < self.n:
+                self.returns_arr[i] = q_i
+
+        self.routes: List[List[int]] = []  # tournées reconstruites à la fin de solve
+
+        # Tournées en listes doublement chaînées (structure de tableaux) :
+        # links[i] sont les deux voisins du client i, le dépôt aux extrémités,
+        # sans sens de parcours. Une tournée est identifiée par l'indice d'un de
+        # ses clients, les tableaux route_* sont indexés par cet identifiant et
+        # route_head / route_tail donnent le sens de parcours de la tournée.
+        self.links = np.empty((0, 2), dtype=np.int32)
+        self.route_head = np.empty(0, dtype=np.int32)
+        self.route_tail = np.empty(0, dtype=np.int32)
+        self.route_size = np.empty(0, dtype=np.int32)
+        self.route_loads = np.empty(0, dtype=np.float64)
+        # coûts de chaque tournée dans son sens de parcours et dans le sens inverse
+        # (la matrice n'est pas forcément symétrique), mis à jour à chaque fusion
+        self.route_costs = np.empty(0, dtype=np.float64)
+        self.route_costs_rev = np.empty(0, dtype=np.float64)
+        self.route_of_customer = np.empty(0, dtype=np.int32)  # client -> identifiant de route
+        # identifiants des tournées existantes, dans l'ordre de la liste des tournées
+        # renvoyée par solve, et position de chaque tournée dans cette liste
+        self.route_order: List[int] = []
+        self.route_position = np.empty(0, dtype=np.int32)
 
     # ---------- Helpers de base ----------
 
     def route_cost(self, route: List[int]) -> float:
         """Coût d'une tournée (somme des distances)."""
-        cost = 0.0
-        for i in range(len(route) - 1):
-            cost += self.d[route[i]][route[i + 1]]
-        return cost
+        return _route_cost_nb(self.d, np.asarray(route, dtype=np.int64))
 
     def total_cost(self, routes: List[List[int]]) -> float:
         return sum(self.route_cost(r) for r in routes)
 
-    def compute_savings(self) -> List[Tuple[float, int, int]]:
+    def compute_savings(self) -> np.ndarray:
         """
         Calcul des savings s_ij = c_0i + c_0j - c_ij
-        pour tous les couples de clients i < j.
+        pour tous les couples de clients i < j. Seuls les savings positifs
+        sont conservés, fusionner avec un saving négatif ou nul n'est jamais rentable,
+        ainsi que les couples tels que q_i + q_j <= Q : les charges des tournées ne
+        font que croître, les autres couples ne pourront jamais être fusionnés.
+        :return: tableau (K, 3) de lignes (s_ij, i, j), trié par savings décroissants
         """
-        savings = []
-        customers = [i for i in range(self.n) if i != self.depot]
-        for i in customers:
-            for j in customers:
-                if j <= i:
-                    continue
-                s_ij = (
-                    self.d[self.depot][i]
-                    + self.d[self.depot][j]
-                    - self.d[i][j]
-                )
-                savings.append((s_ij, i, j))
-        # tri décroissant des savings
-        savings.sort(reverse=True, key=lambda x: x[0])
-        return savings
+        customers = self.customers
+        iu, ju = np.triu_indices(len(customers), k=1)
+        if USE_NUMBA and self.n >= PARALLEL_SAVINGS_MIN_NODES:
+            s = _savings_nb(self.d, self.depot, customers)
+        else:
+            d0 = self.d[self.depot, customers]
+            # matrice de tous les savings, on ne garde que les couples i < j
+            S = d0[:, None] + d0[None, :] - self.d[np.ix_(customers, customers)]
+            s = S[iu, ju]
+        q = self.returns_arr[customers]
+        candidates = (s > 0) & (q[iu] + q[ju] <= self.Q)
+        iu, ju, s = iu[candidates], ju[candidates], s[candidates]
+        # tri décroissant des savings, à égalité on garde l'ordre (i, j) croissant :
+        # tri rapide non stable, puis tri d'une clé entière (rang du saving, position du couple)
+        order = np.argsort(-s)
+        s_sorted = s[order]
+        rank = np.cumsum(np.diff(s_sorted, prepend=s_sorted[:1]) != 0)
+        order = np.sort(rank * len(s) + order) % max(len(s), 1)
+        return np.column_stack((s[order], customers[iu[order]], customers[ju[order]]))
 
     def init_routes(self):
         """
         Initialisation : une tournée par client : 0 - i - 0
         """
-        self.routes = []
-        self.route_loads = []
-        self.route_of_customer = {}
-
-        customers = [i for i in range(self.n) if i != self.depot]
-
-        for idx, i in enumerate(customers):
-            route = [self.depot, i, self.depot]
-            load = self.returns.get(i, 0.0)
-            self.routes.append(route)
-            self.route_loads.append(load)
-            self.route_of_customer[i] = idx
+        self.links = np.full((self.n, 2), self.depot, dtype=np.int32)
+        self.route_head = np.arange(self.n, dtype=np.int32)
+        self.route_tail = np.arange(self.n, dtype=np.int32)
+        self.route_size = np.ones(self.n, dtype=np.int32)
+        self.route_loads = np.zeros(self.n, dtype=np.float64)
+        self.route_of_customer = np.full(self.n, -1, dtype=np.int32)
+
+        # la tournée 0 - i - 0 a pour identifiant i
+        self.route_of_customer[self.customers] = self.customers
+        self.route_loads[self.customers] = self.returns_arr[self.customers]
+        self.route_costs = np.zeros(self.n, dtype=np.float64)
+        self.route_costs[self.customers] = self.d[self.depot, self.customers] + self.d[self.customers, self.depot]
+        self.route_costs_rev = self.route_costs.copy()
+        self.route_order = self.customers.tolist()
+        self.route_position = np.zeros(self.n, dtype=np.int32)
+        self.route_position[self.customers] = np.arange(len(self.customers))
+
+    def iter_route(self, r: int):
+        """
+        Parcourt les clients de la tournée r dans son sens de parcours.
+        """
+        previous, node = self.depot, self.route_head[r]
+        while node != self.depot:
+            yield node
+            first, second = self.links[node]
+            # le voisin suivant est celui par lequel on n'est pas arrivé
+            previous, node = node, (second if first == previous else first)
+
+    def get_routes(self) -> List[List[int]]:
+        """
+        Reconstruit les tournées 0 - ... - 0 en parcourant les chaînages
+        depuis le premier client de chaque tournée, dans l'ordre de route_order.
+        """
+        return [
+            [self.depot] + [int(node) for node in self.iter_route(r)] + [self.depot]
+            for r in self.route_order
+        ]
 
     # ---------- Conditions de fusion de tournées ----------
 
@@ -96,35 +224,65 @@ class ClarkeWrightReverseIRP:
         Vérifie si l'on peut fusionner les tournées contenant i et j
         sans violer la capacité, et en maintenant une tournée simple
         (pas de cycle intermédiaire).
+        Il faut que i et j soient dans deux tournées différentes, chacun à une
+        extrémité de sa tournée (juste après ou juste avant le dépôt).
         """
-        ri = self.route_of_customer[i]
-        rj = self.route_of_customer[j]
-
-        if ri == rj:
-            # déjà dans la même tournée
-            return False
-
-        route_i = self.routes[ri]
-        route_j = self.routes[rj]
+        return bool(_can_merge_nb(
+            i, j, self.route_of_customer, self.route_head, self.route_tail, self.route_loads, self.Q
+        ))
 
-        # i doit être à une extrémité de route_i (juste après ou juste avant le dépôt)
-        # j doit être à une extrémité de route_j
-        i_is_start = (route_i[1] == i)
-        i_is_end = (route_i[-2] == i)
-        j_is_start = (route_j[1] == j)
-        j_is_end = (route_j[-2] == j)
-
-        if not (i_is_start or i_is_end):
-            return False
-        if not (j_is_start or j_is_end):
-            return False
-
-        # Vérification de la capacité si on fusionne les deux tournées
-        new_load = self.route_loads[ri] + self.route_loads[rj]
-        if new_load > self.Q:
-            return False
+    def reverse_route(self, r: int):
+        """
+        Inverse le sens de parcours de la tournée r, les chaînages ne
+        sont pas orientés : seules ses extrémités sont échangées.
+        """
+        self.route_head[r], self.route_tail[r] = self.route_tail[r], self.route_head[r]
+        self.route_costs[r], self.route_costs_rev[r] = self.route_costs_rev[r], self.route_costs[r]
 
-        return True
+    def link(self, a: int, b: int):
+        """
+        Relie le client a au client b, a et b sont deux extrémités de tournées.
+        """
+        self.links[a, 0 if self.links[a, 0] == self.depot else 1] = b
+        self.links[b, 0 if self.links[b, 0] == self.depot else 1] = a
+
+    # Les quatre cas de fusion : chacun renvoie (a, b, ra, rb), la nouvelle
+    # tournée est le raccord ... a - b ... de la tournée ra et de la tournée rb
+
+    def _merge_end_start(self, i, j, ri, rj):
+        # ... i - 0   et   0 - j ...
+        return i, j, ri, rj
+
+    def _merge_start_end(self, i, j, ri, rj):
+        # 0 - i ...   et   ... j - 0
+        return j, i, rj, ri
+
+    def _merge_start_start(self, i, j, ri, rj):
+        # 0 - i ...   et   0 - j ...
+        # On inverse la tournée de i, qui se termine alors par i
+        self.reverse_route(ri)
+        return i, j, ri, rj
+
+    def _merge_end_end(self, i, j, ri, rj):
+        # ... i - 0   et   ... j - 0
+        # On inverse la tournée de j, qui commence alors par j
+        self.reverse_route(rj)
+        return i, j, ri, rj
+
+    # Cas de fusion selon (i_is_start, i_is_end, j_is_start, j_is_end). Un client seul
+    # dans sa tournée en est le début et la fin : les cas sont alors pris dans l'ordre
+    # fin-début, début-fin, début-début, fin-fin
+    _MERGE_CASES = {
+        (False, True, True, False): _merge_end_start,
+        (False, True, True, True): _merge_end_start,
+        (True, True, True, False): _merge_end_start,
+        (True, True, True, True): _merge_end_start,
+        (True, False, False, True): _merge_start_end,
+        (True, True, False, True): _merge_start_end,
+        (True, False, True, True): _merge_start_end,
+        (True, False, True, False): _merge_start_start,
+        (False, True, False, True): _merge_end_end,
+    }
 
     def merge(self, i: int, j: int):
         """
@@ -134,57 +292,58 @@ class ClarkeWrightReverseIRP:
         ri = self.route_of_customer[i]
         rj = self.route_of_customer[j]
 
-        route_i = self.routes[ri]
-        route_j = self.routes[rj]
-
-        i_is_start = (route_i[1] == i)
-        i_is_end = (route_i[-2] == i)
-        j_is_start = (route_j[1] == j)
-        j_is_end = (route_j[-2] == j)
-
-        # On considère les quatre cas possibles
-        if i_is_end and j_is_start:
-            # ... i - 0   et   0 - j ...
-            new_route = route_i[:-1] + route_j[1:]
-        elif i_is_start and j_is_end:
-            # 0 - i ...   et   ... j - 0
-            new_route = route_j[:-1] + route_i[1:]
-        elif i_is_start and j_is_start:
-            # 0 - i ...   et   0 - j ...
-            # On inverse l'une des deux tournées (sauf les dépôts)
-            new_route = route_i[::-1][:-1] + route_j[1:]
-        elif i_is_end and j_is_end:
-            # ... i - 0   et   ... j - 0
-            new_route = route_i[:-1] + route_j[::-1][1:]
-        else:
+        merge_case = self._MERGE_CASES.get((
+            bool(self.route_head[ri] == i), bool(self.route_tail[ri] == i),
+            bool(self.route_head[rj] == j), bool(self.route_tail[rj] == j),
+        ))
+        if merge_case is None:
             # Théoriquement ne devrait pas arriver si can_merge est bien testé
             return
+        a, b, ra, rb = merge_case(self, i, j, ri, rj)
+
+        head = self.route_head[ra]
+        tail = self.route_tail[rb]
+        # Coûts de la nouvelle tournée : les arcs a - 0 et 0 - b sont remplacés par a - b
+        # (b - 0 et 0 - a par b - a dans le sens inverse)
+        depot = self.depot
+        cost = self.route_costs[ra] + self.route_costs[rb] - self.d[a, depot] - self.d[depot, b] + self.d[a, b]
+        cost_rev = (
+            self.route_costs_rev[ra] + self.route_costs_rev[rb]
+            - self.d[b, depot] - self.d[depot, a] + self.d[b, a]
+        )
 
+        # La plus petite des deux tournées est absorbée par la plus grande,
+        # seuls ses clients changent d'identifiant de route
+        if self.route_size[ri] >= self.route_size[rj]:
+            kept, absorbed = ri, rj
+        else:
+            kept, absorbed = rj, ri
+        self.route_of_customer[
+            np.fromiter(self.iter_route(absorbed), dtype=np.int32, count=self.route_size[absorbed])
+        ] = kept
+
+        # Raccord des deux chaînes
+        self.link(a, b)
+
+        self.route_head[kept] = head
+        self.route_tail[kept] = tail
+        self.route_size[kept] += self.route_size[absorbed]
         # Nouvelle charge
-        new_load = self.route_loads[ri] + self.route_loads[rj]
-
-        # Remplacement de ri par la nouvelle tournée, suppression de rj
-        self.routes[ri] = new_route
-        self.route_loads[ri] = new_load
-
-        # Mise à jour mapping client -> index de route
-        for node in new_route:
-            if node != self.depot:
-                self.route_of_customer[node] = ri
-
-        # Pour supprimer rj proprement, on le remplace par la dernière route
-        # et on met à jour les indices
-        last_idx = len(self.routes) - 1
-        if rj != last_idx:
-            self.routes[rj] = self.routes[last_idx]
-            self.route_loads[rj] = self.route_loads[last_idx]
-            # mise à jour des clients qui pointaient sur last_idx
-            for node in self.routes[rj]:
-                if node != self.depot:
-                    self.route_of_customer[node] = rj
-
-        self.routes.pop()
-        self.route_loads.pop()
+        self.route_loads[kept] += self.route_loads[absorbed]
+        self.route_costs[kept] = cost
+        self.route_costs_rev[kept] = cost_rev
+
+        # Ordre des tournées : la nouvelle tournée prend la place de celle de i,
+        # la dernière tournée de la liste prend la place de celle de j
+        position_i = self.route_position[ri]
+        position_j = self.route_position[rj]
+        self.route_order[position_i] = kept
+        self.route_position[kept] = position_i
+        last = self.route_order[-1]
+        if position_j != len(self.route_order) - 1:
+            self.route_order[position_j] = last
+            self.route_position[last] = position_j
+        self.route_order.pop()
 
     # ---------- Solveur principal ----------
 
@@ -198,14 +357,43 @@ class ClarkeWrightReverseIRP:
         # 2. Calcul des savings
         savings_list = self.compute_savings()
 
-        # 3. Parcours des savings triés
-        for s, i, j in savings_list:
-            if self.can_merge(i, j):
-                self.merge(i, j)
-
+        # Une tournée de charge > Q - q_min ne peut plus recevoir aucune autre
+        # tournée : on s'arrête dès qu'il reste moins de deux tournées ouvertes
+        loads = self.route_loads[self.route_order]
+        q_min = loads.min() if len(loads) else 0.0
+        n_open = int(np.count_nonzero(loads + q_min <= self.Q))
+        # Nombre minimal de tournées : les clients tels que q_i > Q restent seuls,
+        # les autres demandent au moins ceil(somme des q_i / Q) tournées. Une fois
+        # ce nombre atteint plus aucune fusion n'est possible (borne légèrement
+        # minorée à cause des arrondis flottants)
+        oversized = loads > self.Q
+        min_routes = int(np.count_nonzero(oversized))
+        if self.Q > 0:
+            min_routes += math.ceil(loads[~oversized].sum() / self.Q * (1 - 1e-9))
+
+        # 3. Parcours des savings triés : la recherche du prochain couple
+        # fusionnable est compilée, seules les fusions repassent par Python
+        savings_i = savings_list[:, 1].astype(np.int32)
+        savings_j = savings_list[:, 2].astype(np.int32)
+        k = 0
+        while n_open >= 2 and len(self.route_order) > min_routes:
+            k = _next_merge_nb(
+                savings_i, savings_j, k,
+                self.route_of_customer, self.route_head, self.route_tail, self.route_loads, self.Q
+            )
+            if k == len(savings_i):
+                break
+            i = int(savings_i[k])
+            self.merge(i, int(savings_j[k]))
+            # les deux tournées fusionnées étaient ouvertes
+            r = self.route_of_customer[i]
+            n_open -= 1 if self.route_loads[r] + q_min <= self.Q else 2
+            k += 1
+
+        self.routes = self.get_routes()
         return ClarkeWrightResult(
             routes=self.routes,
-            total_cost=self.total_cost(self.routes),
+            total_cost=float(self.route_costs[self.route_order].sum()),
         )
 
 
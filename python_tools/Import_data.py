@@ -1,6 +1,28 @@
+from functools import lru_cache
+from pathlib import Path
 import json
+import mmap
+import numpy as np
 import pandas as pd
 
+try:
+    # lecture plus rapide des matrices JSON
+    import orjson
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+try:
+    # lecture plus rapide du fichier CSV des prédictions
+    import pyarrow
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# chemins relatifs à la racine du projet (voir set_project_root)
+DURATIONS_PATH = Path("Maps") / "offline map" / "data" / "durations.json"
+PREDICTION_PATH = Path("Data") / "Linear Prediction.csv"
+
 
 def set_project_root():
     """
@@ -30,38 +52,57 @@ def set_project_root():
         f"en remontant depuis {current_path}"
     )
 
-def import_duration():
-    # Chargement de la matrice de durée depuis un fichier JSON
-    with open("Maps\offline map\data\durations.json", "r", encoding="utf-8") as f:
-        duration_matrix = json.load(f)
+def _file_key(path):
+    """
+    Clé du contenu d'un fichier pour les chargements mémoïsés : chemin absolu et date de modification,
+    le fichier est relu s'il est modifié ou si le répertoire courant change.
+    """
+    path = Path(path).resolve()
+    return path, path.stat().st_mtime_ns
+
+@lru_cache(maxsize=None)
+def _load_matrix(file_key):
+    """
+    Chargement d'une matrice carrée depuis un fichier JSON, lue une seule fois par clé (voir _file_key).
+    Le tableau renvoyé est partagé entre les appels, il est en lecture seule.
+    """
+    path, _ = file_key
+    with path.open("rb") as f:
+        if USE_ORJSON:
+            # le fichier est projeté en mémoire et lu sans copie dans un objet bytes
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                content = orjson.loads(view)
+        else:
+            content = json.load(f)
+    try:
+        matrix = np.asarray(content, dtype=np.float64)
+    except ValueError:
+        # lignes de longueurs différentes
+        raise ValueError("La matrice de distances n'est pas carrée.")
 
     # Vérification rapide
-    n = len(duration_matrix)
-    for row in duration_matrix:
-        if len(row) != n:
-            raise ValueError("La matrice de distances n'est pas carrée.")
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("La matrice de distances n'est pas carrée.")
 
-    return duration_matrix
+    matrix.flags.writeable = False
+    return matrix
 
-def import_distance():
+def import_duration():
     # Chargement de la matrice de durée depuis un fichier JSON
-    with open("Maps\offline map\data\durations.json", "r", encoding="utf-8") as f:
-        distance_matrix = json.load(f)
-
-    # Vérification rapide
-    n = len(distance_matrix)
-    for row in distance_matrix:
-        if len(row) != n:
-            raise ValueError("La matrice de distances n'est pas carrée.")
+    return _load_matrix(_file_key(DURATIONS_PATH))
 
-    return distance_matrix
+def import_distance():
+    # Chargement de la matrice de durée depuis un fichier JSON
+    return _load_matrix(_file_key(DURATIONS_PATH))
 
 def import_prediction():
-    prediction_df = pd.read_csv("Data\Linear Prediction.csv", sep=";")
-    prediction_df = prediction_df[["Identifier","Daily (Kg)", "Daily (L)"]]
-    res = (prediction_df.groupby("Identifier")[["Daily (Kg)", "Daily (L)"]].agg("first"))  # ou .agg({"Daily (Kg)": "first", "Daily (L)": "first"})
-    Daily_kg = list(res["Daily (Kg)"])
-    Daily_L = list(res["Daily (L)"])
+    prediction_df = pd.read_csv(
+        PREDICTION_PATH, sep=";", usecols=["Identifier", "Daily (Kg)", "Daily (L)"], engine=CSV_ENGINE
+    )
+    # première prédiction de chaque point, triée par identifiant
+    res = prediction_df.drop_duplicates("Identifier", keep="first").sort_values("Identifier")
+    Daily_kg = res["Daily (Kg)"].to_numpy()
+    Daily_L = res["Daily (L)"].to_numpy()
     return Daily_kg, Daily_L
 
 class DataProblem :
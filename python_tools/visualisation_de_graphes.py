@@ -1,19 +1,23 @@
 import networkx as nx
 import matplotlib.pyplot as plt
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
 
 
 
 def visualiser_graphe(D):
      n = len(D)
-     noms = ['A', 'B', 'C', 'D', 'E', 'F','OUT']
+     D = np.asarray(D)
+     noms = np.array(['A', 'B', 'C', 'D', 'E', 'F','OUT'][:n])
      G = nx.Graph()
      # Ajouter les sommets avec noms
-     G.add_nodes_from(noms[:n])
-     # Ajouter les arêtes avec poids
-     for i in range(n):
-          for j in range(i+1, n):
-               if D[i][j] != 0:
-                    G.add_edge(noms[i], noms[j], weight=D[i][j])
+     G.add_nodes_from(noms.tolist())
+     # Ajouter les arêtes avec poids (triangle supérieur, poids non nuls)
+     i, j = np.triu_indices(n, 1)
+     w = D[i, j]
+     masque = w != 0
+     G.add_weighted_edges_from(zip(noms[i[masque]].tolist(), noms[j[masque]].tolist(), w[masque].tolist()))
      pos = nx.spring_layout(G, seed=42)
      edge_labels = nx.get_edge_attributes(G, 'weight')
      nx.draw(G, pos, with_labels=True, node_color='skyblue', node_size=700, font_size=14)
@@ -22,24 +26,14 @@ def visualiser_graphe(D):
      plt.show()
 
 def matrice_adjacence_vers_distance(D):
-    n = len(D)
-    G = nx.Graph()
-    for i in range(n):
-        for j in range(n):
-            if D[i][j] != 0:
-                G.add_edge(i, j, weight=D[i][j])
-    # Calculer toutes les distances minimales
-    dist = [[0]*n for _ in range(n)]
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                dist[i][j] = 0
-            else:
-                try:
-                    dist[i][j] = nx.shortest_path_length(G, i, j, weight='weight')
-                except nx.NetworkXNoPath:
-                    dist[i][j] = float('inf')  # ou une grande valeur
-    return dist
+    D = np.asarray(D, dtype=float)
+    # Graphe non orienté : comme pour nx.Graph, le poids D[j][i] (i < j) remplace D[i][j] s'il est non nul
+    U = np.triu(D)
+    L = np.tril(D).T
+    W = np.where(L != 0, L, U)
+    # Calculer toutes les distances minimales (Dijkstra depuis chaque sommet), inf s'il n'y a pas de chemin
+    dist = shortest_path(csr_matrix(W), method='D', directed=False)
+    return dist.tolist()
 
 if __name__ == "__main__":
     D = [[0,1,0,0,0,0],